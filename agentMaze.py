@@ -25,30 +25,41 @@ def _getEstimates(transs, utils, currState, R_plus=None, N_e=None, currActions=N
 	For every possible action in currState
 		- get frequencies newState|currState,action
 		- count them: n
-		- get probabilities: divide freqs with n
-		- calculate estimate with bellman
+		- calculate estimate with bellman as the frequency
+		  weighted sum of utilities divided by n
 
 	Return (rewardEstimate, action) pairs in a dict
 	"""
+	return list(_iterEstimates(transs, utils, currState, R_plus, N_e, currActions))
 
-	estimates = []
+
+def _bestEstimate(transs, utils, currState, R_plus=None, N_e=None, currActions=None):
+	"""
+	Same as max(_getEstimates(...)), but only the best (rewardEstimate, action)
+	pair is kept while going over the actions instead of building the list.
+	"""
+	return max(_iterEstimates(transs, utils, currState, R_plus, N_e, currActions))
+
+
+def _iterEstimates(transs, utils, currState, R_plus=None, N_e=None, currActions=None):
 	for ac in (currActions or transs.get(currState, {})):
 		# We get N_s_a from transition table.
 		freq = transs.get(currState, {}).get(ac, {})
 
-		# Number of states.
-		n = sum(val for val in freq.values())
-		probs = dict((key, float(val) / n) for key, val in freq.iteritems())
-		u = sum(p * utils.get(s, 0) for s, p in probs.iteritems())
-
 		# This if function f from page 842. Otherwise we are doing normal estimation.
 		# It means if the number of actions a that were executed in state s is not high enough,
 		# it means we should set some optimistic reward to search more into that direction.
-		if R_plus is not None and N_e is not None and n < N_e:
-			estimates.append((R_plus, ac, ))
-		else:
-			estimates.append((u, ac, ))
-	return estimates
+		# The utilities are not needed for that.
+		if R_plus is not None and N_e is not None and sum(freq.values()) < N_e:
+			yield R_plus, ac
+			continue
+
+		# Number of states and the weighted sum of utilities in a single pass.
+		n, u = 0, 0.
+		for s, val in freq.items():
+			n += val
+			u += val * utils.get(s, 0)
+		yield u / n if n else 0., ac
 
 
 def _policy_iteration(transs, utils, policy, rewards, R_plus=None, N_e=None, th=1):
@@ -57,20 +68,12 @@ def _policy_iteration(transs, utils, policy, rewards, R_plus=None, N_e=None, th=
 		for state in transs:
 			if state not in rewards:
 				continue
-			estimates = max(_getEstimates(transs, utils, state, R_plus, N_e))[0]
+			estimates = _bestEstimate(transs, utils, state, R_plus, N_e)[0]
 			utils[state] = rewards[state] + th * estimates
 
 		changes = False
 		for state in transs:
-			estimates = []
-			for ac in transs.get(state, {}):
-				freq = transs.get(state, {}).get(ac, {})
-				# Number of states.
-				n = sum(val for val in freq.values())
-				probs = dict((key, float(val) / n) for key, val in freq.iteritems())
-	
-				estimates.append((sum(p * utils.get(s, 0) for s, p in probs.iteritems()), ac, ))
-	
+			estimates = _getEstimates(transs, utils, state)
 			if not estimates:
 				continue
 			
@@ -140,9 +143,8 @@ def adp_random_exploration(env, transs={}, utils={}, freqs={}, policy={},
 		rewards[newState] = reward
 		rewardSum += reward
 		
-		# Set to zero if newState does not exist yet. For new state?
-		freqs.setdefault(newState, 0)
-		freqs[newState] += 1
+		# Count the visit of the state the transition was observed from.
+		freqs[state] = freqs.get(state, 0) + 1
 		
 		# update transition table. The first one returns dictionary of actions for specific state and the
 		# second one a dictionary of possible states from specific action (best action).
@@ -215,9 +217,8 @@ def adp_optimistic_rewards(env, transs={}, utils={}, freqs={}, policy={},
 		rewards[newState] = reward
 		rewardSum += reward
 
-		# Set to zero if newState does not exist yet. For new state?
-		freqs.setdefault(newState, 0)
-		freqs[newState] += 1
+		# Count the visit of the state the transition was observed from.
+		freqs[state] = freqs.get(state, 0) + 1
 
 		# update transition table. The first one returns dictionary of actions for specific state and the
 		# second one a dictionary of possible states from specific action (best action).
@@ -271,7 +272,7 @@ class Agent():
 		policy = {}
 		# For every state set appropriate action.
 		for state in self.transTable:
-			policy[state] = max(_getEstimates(self.transTable, self.uTable, state))[1]
+			policy[state] = _bestEstimate(self.transTable, self.uTable, state)[1]
 		return policy
 
 	def learn(self, env, alg=adp_random_exploration, numOfTrials=150, **kwargs):
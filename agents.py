@@ -1,6 +1,12 @@
 import random
+from multiprocessing import Pool
+import numpy as np
+from numba import njit
 import environments as env
 
+# Values of the step size function _alpha for the first n visits.
+ALPHA = 50. / (49 + np.arange(1 << 16))
+
 def _alpha(n):
 	"""
 	The step size function to ensure convergence. The
@@ -9,81 +15,334 @@ def _alpha(n):
 	utility of policy pi for state s will converge to
 	correct value.
 	"""
-	return 50. / (49 + n)
+	return ALPHA[n] if n < len(ALPHA) else 50. / (49 + n)
+
+
+# Options of the compiled kernels. The signatures declare the tables as
+# C-contiguous arrays, so indexing them compiles to plain pointer arithmetic.
+_JIT = dict(fastmath=True, cache=True)
 
 
-def _getEstimates(transs, utils, currState, R_plus=None, N_e=None, currActions=None):
+def _steps(alpha, n):
 	"""
-	Gets estimates according to current transition states,
-	utility, current state and actions that can be executed
-	in current state.
+	Returns values alpha(0), ..., alpha(n - 1) of the step size
+	function, taken from ALPHA for the default one.
+	"""
+	if alpha is _alpha and n <= len(ALPHA):
+		return ALPHA[:n]
+	return np.array([alpha(i) for i in range(n)])
 
-	transs keys:
-	currState => actions => newState
 
-	For every possible action in currState
-		- get frequencies newState|currState,action
-		- count them: n
-		- get probabilities: divide freqs with n
-		- calculate estimate with bellman
+def _choice(actions, u):
+	"""
+	Chooses an action with a uniform random number u from [0, 1).
+	"""
+	return actions[int(u * len(actions))]
+
 
-	Return (rewardEstimate, action) pairs in a dict
+def _resized(table, shape, fill=0):
 	"""
+	Returns a copy of table enlarged to shape. The old entries
+	keep their indices, the new ones are set to fill.
+	"""
+	new = np.full(shape, fill, dtype=table.dtype)
+	new[tuple(slice(0, n) for n in table.shape)] = table
+	return new
 
-	estimates = []
-	for ac in (currActions or transs.get(currState, {})):
-		# We get N_s_a from transition table.
-		freq = transs.get(currState, {}).get(ac, {})
-
-		# Number of states.
-		n = sum(val for val in freq.values())
-		probs = dict((key, float(val) / n) for key, val in freq.iteritems())
-		u = sum(p * utils.get(s, 0) for s, p in probs.iteritems())
-
-		# This if function f from page 842. Otherwise we are doing normal estimation.
-		# It means if the number of actions a that were executed in state s is not high enough,
-		# it means we should set some optimistic reward to search more into that direction.
-		if R_plus is not None and N_e is not None and n < N_e:
-			estimates.append((R_plus, ac, ))
-		else:
-			estimates.append((u, ac, ))
-	return estimates
 
+class TransitionModel():
+	"""
+	Learned model of the environment stored as a structure of
+	NumPy arrays. States and actions are given integer ids in the
+	order they are first seen and all the tables are indexed by them:
+
+	head[s, a] - first observed outcome of action a in state s, -1 if none
+	Nsa[s, a] - how many times action a was executed in state s (N_sa),
+	the sum of the counts of its outcomes kept up to date on every transition
+	U[s] - utilities, in single precision as the estimates only need
+	to converge to about 1e-3 and half the bytes are read
+	R[s] - rewards, valid only where hasReward[s] is set
+	freqs[s] - how many times the agent left state s
+	known[s, a] - action a can be executed in state s
+	policy[s] - id of the best action in state s, -1 if there is none yet
+
+	The outcome frequencies (N_s'_sa) are sparse, most next states are
+	never observed after a state and action. Only the observed outcomes
+	are stored, in a list of edges per state and action:
+
+	dest[e] - the next state s' of outcome e
+	count[e] - how many times the outcome was observed
+	nextEdge[e] - the next outcome of the same state and action, -1 at the end
+
+	edgeId finds the edge of (s, a, s') by the ids packed into one int.
+
+	When a new state, action or outcome does not fit, the capacity is doubled.
+	clear keeps the capacity, so a model reused for another learning
+	run does not have to grow again.
+	"""
+
+	def __init__(self, nStates=64, nActions=4):
+		self.stateId, self.states = {}, []
+		self.actionId, self.actions = {}, []
+
+		# Actions of every state as returned by the environment.
+		self.stateActions = {}
+
+		self.edgeId, self.nEdges = {}, 0
+		self.head = np.full((nStates, nActions), -1, dtype=np.int32)
+		self.nextEdge = np.zeros(2 * nStates, dtype=np.int32)
+		self.dest = np.zeros(2 * nStates, dtype=np.int32)
+		self.count = np.zeros(2 * nStates, dtype=np.int32)
+		self.Nsa = np.zeros((nStates, nActions), dtype=np.int32)
+		self.U = np.zeros(nStates, dtype=np.float32)
+		self.R = np.zeros(nStates, dtype=np.float64)
+		self.hasReward = np.zeros(nStates, dtype=np.bool_)
+		self.freqs = np.zeros(nStates, dtype=np.int32)
+		self.known = np.zeros((nStates, nActions), dtype=np.bool_)
+		self.policy = np.full(nStates, -1, dtype=np.int32)
+
+	def clear(self):
+		"""
+		Forgets all the experience but keeps the allocated tables.
+		"""
+		ns, na = len(self.states), len(self.actions)
+		self.stateId, self.states = {}, []
+		self.actionId, self.actions = {}, []
+		self.stateActions = {}
+		self.edgeId, self.nEdges = {}, 0
+
+		self.head[:ns, :na] = -1
+		self.Nsa[:ns, :na] = 0
+		self.U[:ns] = 0
+		self.R[:ns] = 0
+		self.hasReward[:ns] = False
+		self.freqs[:ns] = 0
+		self.known[:ns, :na] = False
+		self.policy[:ns] = -1
+
+	def _grow(self, nStates, nActions):
+		self.head = _resized(self.head, (nStates, nActions), -1)
+		self.Nsa = _resized(self.Nsa, (nStates, nActions))
+		self.U = _resized(self.U, nStates)
+		self.R = _resized(self.R, nStates)
+		self.hasReward = _resized(self.hasReward, nStates)
+		self.freqs = _resized(self.freqs, nStates)
+		self.known = _resized(self.known, (nStates, nActions))
+		self.policy = _resized(self.policy, nStates, -1)
+
+	def _growEdges(self, nEdges):
+		self.nextEdge = _resized(self.nextEdge, nEdges)
+		self.dest = _resized(self.dest, nEdges)
+		self.count = _resized(self.count, nEdges)
+
+	def edgeIndex(self, s, a, sp):
+		key = (s << 32 | a) << 32 | sp
+		e = self.edgeId.get(key)
+		if e is None:
+			e = self.nEdges
+			if e == len(self.count):
+				self._growEdges(2 * e)
+			self.dest[e], self.count[e] = sp, 0
+			self.nextEdge[e], self.head[s, a] = self.head[s, a], e
+			self.edgeId[key] = e
+			self.nEdges += 1
+		return e
+
+	def stateIndex(self, state):
+		s = self.stateId.get(state)
+		if s is None:
+			s = len(self.states)
+			if s == self.U.shape[0]:
+				self._grow(2 * s, self.known.shape[1])
+			self.stateId[state] = s
+			self.states.append(state)
+		return s
+
+	def actionIndex(self, action):
+		a = self.actionId.get(action)
+		if a is None:
+			a = len(self.actions)
+			if a == self.known.shape[1]:
+				self._grow(self.U.shape[0], 2 * a)
+			self.actionId[action] = a
+			self.actions.append(action)
+		return a
+
+	def addActions(self, state, actions):
+		"""
+		Remembers actions that can be executed in state.
+		"""
+		s = self.stateIndex(state)
+		for ac in actions:
+			a = self.actionIndex(ac)
+			self.known[s, a] = True
+
+	def getActions(self, env, state):
+		"""
+		Returns actions that can be executed in state. The environment
+		is asked only the first time, the actions of a state never change.
+		"""
+		actions = self.stateActions.get(state)
+		if actions is None:
+			actions = env.getActions(state)
+			self.addActions(state, actions)
+			self.stateActions[state] = actions
+		return actions
+
+	def update(self, state, action, newState, reward):
+		"""
+		Records the outcome of executing action in state.
+		"""
+		s, a = self.stateIndex(state), self.actionIndex(action)
+		sp = self.stateIndex(newState)
+		e = self.edgeIndex(s, a, sp)
+		self.count[e] += 1
+		self.Nsa[s, a] += 1
+		self.R[sp] = reward
+		self.hasReward[sp] = True
+		self.freqs[s] += 1
+
+	def merge(self, other):
+		"""
+		Adds the experience gathered in other model to this one. The
+		outcome and visit frequencies are summed and the utilities are
+		averaged, weighted by the number of visits of each state. The
+		policy of a state is taken from the model that visited it more.
+		States that neither model left keep their utilities, averaged
+		if both models have them.
+		"""
+		nOld = len(self.states)
+		states = np.array([self.stateIndex(state) for state in other.states], dtype=np.intp)
+		actions = np.array([self.actionIndex(ac) for ac in other.actions], dtype=np.intp)
+		ns, na = len(states), len(actions)
+		if not ns:
+			return
+
+		freqs, otherFreqs = self.freqs[states], other.freqs[:ns]
+		otherPolicy = other.policy[:ns]
+		take = (otherPolicy >= 0) & ((self.policy[states] < 0) | (otherFreqs > freqs))
+		self.policy[states[take]] = actions[otherPolicy[take]]
+
+		# Without visits in both models the weights fall back to 1 for the
+		# models that have the state, so its utility is not reset to zero.
+		total = freqs + otherFreqs
+		weights = np.where(total > 0, freqs, states < nOld)
+		otherWeights = np.where(total > 0, otherFreqs, 1)
+		self.U[states] = (self.U[states] * weights + other.U[:ns] * otherWeights) / (weights + otherWeights)
+		self.freqs[states] = total
+
+		self.R[states] = np.where(other.hasReward[:ns], other.R[:ns], self.R[states])
+		self.hasReward[states] |= other.hasReward[:ns]
+		if na:
+			self.known[np.ix_(states, actions)] |= other.known[:ns, :na]
+			self.Nsa[np.ix_(states, actions)] += other.Nsa[:ns, :na]
+		for key, e in other.edgeId.items():
+			s, a, sp = states[key >> 64], actions[key >> 32 & 0xffffffff], states[other.dest[e]]
+			edge = self.edgeIndex(int(s), int(a), int(sp))
+			self.count[edge] += other.count[e]
+
+	def policyAction(self, state, default=None):
+		s = self.stateId.get(state)
+		if s is None or self.policy[s] < 0:
+			return default
+		return self.actions[self.policy[s]]
 
-def _policy_iteration(transs, utils, policy, rewards, R_plus=None, N_e=None, th=1):
+	def getPolicy(self):
+		"""
+		Returns the policy as a dict state => action for all states
+		that have a best action.
+		"""
+		ids = np.flatnonzero(self.policy[:len(self.states)] >= 0)
+		states, actions = self.states, self.actions
+		return dict(zip([states[s] for s in ids], [actions[a] for a in self.policy[ids]]))
+
+
+@njit('float64(int32[:, ::1], int32[::1], int32[::1], int32[::1], int32[:, ::1], float32[::1], '
+	  'int64, int64, boolean, float64, int64)', **_JIT)
+def _getEstimate(head, nextEdge, dest, count, Nsa, U, s, a, optimistic, R_plus, N_e):
+	"""
+	Gets estimate of action a in state s according to current
+	transition states and utility:
+		- take the count of outcome frequencies N_s'_sa: n = Nsa[s, a]
+		- calculate estimate with bellman as the frequency
+		  weighted sum of utilities divided by n, going only
+		  over the observed outcomes
+	"""
+	n, u = Nsa[s, a], np.float32(0.)
+	e = head[s, a]
+	while e >= 0:
+		u += np.float32(count[e]) * U[dest[e]]
+		e = nextEdge[e]
+
+	# This if function f from page 842. Otherwise we are doing normal estimation.
+	# It means if the number of actions a that were executed in state s is not high enough,
+	# it means we should set some optimistic reward to search more into that direction.
+	# Both values are computed and one is selected, so there is no branch on n.
+	est = u / max(n, 1)
+	return R_plus if optimistic & (n < N_e) else est
+
+
+@njit('Tuple((float64, int64, float64))(int32[:, ::1], int32[::1], int32[::1], int32[::1], int32[:, ::1], '
+	  'float32[::1], boolean[:, ::1], int64, int64, boolean, float64, int64, int64)', **_JIT)
+def _bestEstimate(head, nextEdge, dest, count, Nsa, U, known, s, na, optimistic, R_plus, N_e, polAct):
+	"""
+	Returns (rewardEstimate, action) of the best action that can
+	be executed in state s and the estimate of action polAct, which
+	is found on the way. The action is -1 if there is none.
+	"""
+	maxEst, maxAct, polEst = 0., -1, 0.
+	for a in range(na):
+		if not known[s, a]:
+			continue
+		est = _getEstimate(head, nextEdge, dest, count, Nsa, U, s, a, optimistic, R_plus, N_e)
+		if a == polAct:
+			polEst = est
+		if maxAct < 0 or est > maxEst:
+			maxEst, maxAct = est, a
+	return maxEst, maxAct, polEst
+
+
+@njit('void(int32[:, ::1], int32[::1], int32[::1], int32[::1], int32[:, ::1], float32[::1], float64[::1], '
+	  'boolean[::1], boolean[:, ::1], int32[::1], int64, int64, boolean, float64, int64, float64)', **_JIT)
+def _policy_iteration_kernel(head, nextEdge, dest, count, Nsa, U, R, hasReward, known, policy,
+							 ns, na, optimistic, R_plus, N_e, th):
 	changes = True
 	while changes:
-		for state in transs:
-			if state not in rewards:
+		for s in range(ns):
+			if not hasReward[s]:
 				continue
-			estimates = max(_getEstimates(transs, utils, state, R_plus, N_e))[0]
-			utils[state] = rewards[state] + th * estimates
-	
+			maxEst, maxAct, _ = _bestEstimate(head, nextEdge, dest, count, Nsa, U, known, s, na, optimistic, R_plus, N_e, -1)
+			if maxAct >= 0:
+				U[s] = R[s] + th * maxEst
+
 		changes = False
-		for state in transs:
-			estimates = []
-			for ac in transs.get(state, {}):
-				freq = transs.get(state, {}).get(ac, {})
-				# Number of states.
-				n = sum(val for val in freq.values())
-				probs = dict((key, float(val) / n) for key, val in freq.iteritems())
-	
-				estimates.append((sum(p * utils.get(s, 0) for s, p in probs.iteritems()), ac, ))
-	
-			if not estimates:
+		for s in range(ns):
+			polAct = policy[s]
+			maxEst, maxAct, polEst = _bestEstimate(head, nextEdge, dest, count, Nsa, U, known, s, na, False, 0., 0, polAct)
+			if maxAct < 0:
 				continue
-			
-			maxEst, maxAct = max(estimates)
-	
-			polEst = dict((act, est, ) for est, act in estimates)[policy.get(state, maxAct)]
-	
-			if maxEst > polEst or policy.get(state, None) is None:
-				policy[state] = maxAct
+
+			# Only a real improvement changes the policy. Single precision
+			# rounding of the utilities could otherwise flip it between
+			# two equally good actions forever.
+			if polAct < 0 or maxEst - polEst > 1e-5 * (1. + abs(maxEst)):
+				policy[s] = maxAct
 				changes = True
 
 
-def adp_random_exploration(env, transs={}, utils={}, freqs={}, policy={},
-						   rewards={}, **kwargs):
+def _policy_iteration(model, R_plus=None, N_e=None, th=1):
+	"""
+	Runs the compiled policy iteration on the tables of model. Only
+	the number crunching is compiled, the environment is still
+	stepped by the interpreter in the adp_* functions.
+	"""
+	optimistic = R_plus is not None and N_e is not None
+	_policy_iteration_kernel(model.head, model.nextEdge, model.dest, model.count, model.Nsa, model.U, model.R,
+							 model.hasReward, model.known, model.policy, len(model.states), len(model.actions),
+							 optimistic, float(R_plus or 0), int(N_e or 0), float(th))
+
+
+def adp_random_exploration(env, model=None, **kwargs):
 	"""
 	Active ADP (adaptive dynamic programming) learning
 	algorithm which returns the best policy for a given
@@ -100,13 +359,12 @@ def adp_random_exploration(env, transs={}, utils={}, freqs={}, policy={},
 	For reference look in page 834.
 
 	@param env: Environment
-	@param transs: A transition table (N_s'_sa) with outcome frequencies given state action pairs, initially zero.
-	@param utils: Utilities table
-	@param freqs: A table of frequencies (N_sa) for state-action pairs, initially zero.
+	@param model: TransitionModel with transition, utilities and frequency tables, initially empty.
 	@param t: A parameter for choosing best action or random action.
 	@param tStep: A step to increment parameter t.
 	@param alpha: Step size function
 	@param maxItr: Maximum iterations
+	@param rng: numpy RandomState for exploration
 	"""
 
 	
@@ -116,24 +374,37 @@ def adp_random_exploration(env, transs={}, utils={}, freqs={}, policy={},
 	tFac = kwargs.get('tFac', 1.)
 	t = kwargs.get('currItrs', 0)/5 if kwargs.get('remember', False) else 0
 	minRnd = kwargs.get('minRnd', 0.0)
+	rng = kwargs.get('rng', np.random)
 	
+	if model is None:
+		model = TransitionModel()
+
 	itr = 0
 	isTerminal = False
 	state = env.getStartingState()
 	rewardSum = 0
 
+	# Random numbers for the whole trial are drawn at once.
+	choiceDraws = rng.random_sample(maxItr)
+	exploreDraws = rng.random_sample(maxItr)
+
+	# Probabilities of a random action and step sizes for every step. The
+	# parameter t grows by tStep every step, so they are known in advance.
+	explore = np.maximum(minRnd, 1. / (tFac * (t + tStep * np.arange(maxItr) + 1)))
+	ths = _steps(alpha, maxItr)
+
 	lastReward = False
 	
 	# Get possible actions with respect to current state.
-	actions = env.getActions(state)
-	_policy_iteration(transs, utils, policy, rewards, th=alpha(itr) )
-	bestAction = policy.get(state, random.choice(actions))
+	actions = model.getActions(env, state)
+	_policy_iteration(model, th=ths[itr])
+	bestAction = model.policyAction(state)
 	
 	while not isTerminal: # while not terminal
-		if random.random() < max(minRnd, 1. / (tFac*(t+1))) or bestAction is None:
+		if exploreDraws[itr] < explore[itr] or bestAction is None:
 			# If it is the first iteration or exploration event
 			# then randomly choose an action. Taking a random action in 1/t instances.
-			bestAction = random.choice(actions)
+			bestAction = _choice(actions, choiceDraws[itr])
 		
 		# do the action with the best policy
 		# or do some random exploration
@@ -141,24 +412,15 @@ def adp_random_exploration(env, transs={}, utils={}, freqs={}, policy={},
 
 		lastReward = reward >= 0
 		
-		rewards[newState] = reward
 		rewardSum += reward
-		
-		# Set to zero if newState does not exist yet. For new state?
-		freqs.setdefault(newState, 0)
-		freqs[newState] += 1
 
-		# update transition table. The first one returns dictionary of actions for specific state and the
-		# second one a dictionary of possible states from specific action (best action).
-		transs.setdefault(state, {}).setdefault(bestAction, {}).setdefault(newState, 0)
-		transs[state][bestAction][newState] += 1
+		# update transition table (N_s'_sa), reward of newState and frequency of state.
+		model.update(state, bestAction, newState, reward)
 
-		actions = env.getActions(newState)
-		for ac in actions:
-			transs.setdefault(newState, {}).setdefault(ac, {})
-		_policy_iteration(transs, utils, policy, rewards, th=alpha(itr))
+		actions = model.getActions(env, newState)
+		_policy_iteration(model, th=ths[itr])
 		
-		bestAction = policy.get(newState, random.choice(actions))
+		bestAction = model.policyAction(newState)
 		
 		# Is this part from the book:
 		# Having obtained a utility function U that is optimal for the learned model,
@@ -171,73 +433,69 @@ def adp_random_exploration(env, transs={}, utils={}, freqs={}, policy={},
 
 		# A GLIE scheme must also eventually become greedy, so that the agent's actions
 		# become optimal with respect to the learned (and hence the true) model. That is
-		# why the parameter t needs to be incremented.
-		t, itr = t + tStep, itr + 1
+		# why the parameter t is incremented in explore.
+		itr += 1
 		if itr >= maxItr:
 			break
 	return itr, rewardSum, lastReward
 
-def adp_optimistic_rewards(env, transs={}, utils={}, freqs={}, policy={},
-						   rewards = {}, **kwargs):
+def adp_optimistic_rewards(env, model=None, **kwargs):
 	"""
 	Active ADP (adaptive dynamic programming)
 
 	@param env: Environment
-	@param transs: A transition table (N_s'_sa) with outcome frequencies given state action pairs, initially zero.
-	@param utils: Utilities table
-	@param freqs: A table of frequencies (N_sa) for state-action pairs, initially zero.
+	@param model: TransitionModel with transition, utilities and frequency tables, initially empty.
 	@param R_plus: An optimistic estimate of the best possible reward obtainable in any state.
 	@param N_e: Limit of how many number of optimistic reward is given before true utility.
 	@param alpha: Step size function
 	@param maxItr: Maximum iterations
+	@param rng: numpy RandomState for exploration
 	"""
 	R_plus = kwargs.get('R_plus', 5)
 	N_e = kwargs.get('N_e', 12)
 	alpha = kwargs.get('alpha', _alpha)
 	maxItr = kwargs.get('maxItr', 10)
+	rng = kwargs.get('rng', np.random)
+
+	if model is None:
+		model = TransitionModel()
 
 	itr = 0
 	isTerminal = False
 	state = env.getStartingState()
 	rewardSum = 0
+
+	# Random numbers for the whole trial are drawn at once.
+	choiceDraws = rng.random_sample(maxItr)
+	ths = _steps(alpha, maxItr)
 	lastReward = False
 
 	
 	# Get possible actions with respect to current state.
-	actions = env.getActions(state)
-	_policy_iteration(transs, utils, policy, rewards, R_plus=R_plus, N_e=N_e, th=alpha(itr))
-	bestAction = policy.get(state, random.choice(actions))
+	actions = model.getActions(env, state)
+	_policy_iteration(model, R_plus=R_plus, N_e=N_e, th=ths[itr])
+	bestAction = model.policyAction(state)
 
 	while not isTerminal: # while not terminal
 		if bestAction is None:
 			# If it is the first iteration or exploration event
 			# then randomly choose an action. Taking a random action in 1/t instances.
-			bestAction = random.choice(actions)
+			bestAction = _choice(actions, choiceDraws[itr])
 
 		# do the action with the best policy
 		# or do some random exploration
 		newState, reward, isTerminal = env.do(state, bestAction)
-		rewards[newState] = reward
 		rewardSum += reward
 		lastReward = reward >= 0
 
-		# Set to zero if newState does not exist yet. For new state?
-		freqs.setdefault(newState, 0)
-		freqs[newState] += 1
-
-		# update transition table. The first one returns dictionary of actions for specific state and the
-		# second one a dictionary of possible states from specific action (best action).
-		transs.setdefault(state, {}).setdefault(bestAction, {}).setdefault(newState, 0)
-		transs[state][bestAction][newState] += 1
+		# update transition table (N_s'_sa), reward of newState and frequency of state.
+		model.update(state, bestAction, newState, reward)
 
 		# We need to get actions on new state.
-		actions = env.getActions(newState)
-		for ac in actions:
-			transs.setdefault(newState, {}).setdefault(ac, {})
-		_policy_iteration(transs, utils, policy, rewards, R_plus=R_plus, N_e=N_e, th=alpha(itr))
+		actions = model.getActions(env, newState)
+		_policy_iteration(model, R_plus=R_plus, N_e=N_e, th=ths[itr])
 
-		#rewardEstimate, bestAction = max(_getEstimatesOptimistic(transs, utils, state, R_plus, N_e, actions))
-		bestAction = policy.get(newState, random.choice(actions))
+		bestAction = model.policyAction(newState)
 		state = newState
 
 		itr += 1
@@ -252,50 +510,48 @@ class Agent():
 		self.clearExperience()
 
 	def clearExperience(self):
-		# Frequency table.
-		self.nTable = {}
-
-		# Transition table.
-		self.transTable = {}
-
-		# Utilities table.
-		self.uTable = {}
+		# Transition, utilities, frequency, rewards and policy tables.
+		# Once allocated they are reused by the next learning runs.
+		if getattr(self, 'model', None) is None:
+			self.model = TransitionModel()
+		else:
+			self.model.clear()
 
 		# Results
 		self.results = []
 
-		# Policy table
-		self.policyTable = {}
-
-		# Rewards table
-		self.rewardsTable = {}
-
 		# history
 		self.history = []
 		
 	def getPolicy(self):
-		return self.policyTable
+		return self.model.getPolicy()
 
-	def learn(self, env, alg=adp_random_exploration, numOfTrials=150, **kwargs):
+	def learn(self, env, alg=adp_random_exploration, numOfTrials=150, numOfWorkers=1, seed=None, **kwargs):
 		"""
 		Learn best policy given the environment, algorithm and number of trials.
 		@param env:
 		@param alg:
 		@param numOfTrials:
+		@param numOfWorkers: Number of processes the trials are split between. Every
+		process learns its own model, the models are merged at the end. With
+		remember=True each process counts only its own iterations, so the
+		exploration decays numOfWorkers times slower than in a single process.
+		@param seed: Seed of the random numbers used for exploration.
 		"""
 		
 		
 		itrs = 0
 		self.clearExperience()
+		if numOfWorkers > 1:
+			return self._learnParallel(env, alg, numOfTrials, numOfWorkers, seed, **kwargs)
+
+		rng = np.random.RandomState(seed)
 		for trial in range(numOfTrials):
 			currItrs, reward, win = alg(env,
-						transs=self.transTable,
-						utils=self.uTable,
-						freqs=self.nTable,
+						model=self.model,
 						currItrs=itrs,
 						results=self.results,
-						policy=self.policyTable,
-						rewards=self.rewardsTable,
+						rng=rng,
 						**kwargs)
 			itrs += currItrs
 
@@ -310,6 +566,27 @@ class Agent():
 			})
 		return self.getPolicy()
 
+	def _learnParallel(self, env, alg, numOfTrials, numOfWorkers, seed, **kwargs):
+		chunks = [numOfTrials // numOfWorkers + (w < numOfTrials % numOfWorkers) for w in range(numOfWorkers)]
+		seeds = [None if seed is None else seed + w for w in range(numOfWorkers)]
+		pool = Pool(numOfWorkers)
+		try:
+			parts = pool.map(_learnWorker, [(env, alg, n, s, kwargs) for n, s in zip(chunks, seeds) if n])
+		finally:
+			pool.close()
+			pool.join()
+
+		for model, history in parts:
+			self.model.merge(model)
+			self.history.extend(history)
+
+		# The merged policy is taken state by state from the workers, so
+		# derive it again from the merged counts and utilities. These were
+		# learned with the step sizes of whole trials, their mean is used.
+		ths = _steps(kwargs.get('alpha', _alpha), kwargs.get('maxItr', 10))
+		_policy_iteration(self.model, th=ths.mean())
+		return self.getPolicy()
+
 	def solve(self, env, policy):
 		# solve environment with respect to policy
 		actions, energy = [], 0
@@ -333,6 +610,19 @@ class Agent():
 			# We get a list of actions that were executed and sum of rewards that were given when agent entered certain state.
 		return actions, energy
 
+def _learnWorker(args):
+	"""
+	Runs a share of the trials in a worker process of Agent.learn
+	and returns the learned model with the history of the trials.
+	"""
+	env, alg, numOfTrials, seed, kwargs = args
+
+	# Forked workers inherit the same random state.
+	random.seed(seed)
+	agent = Agent()
+	agent.learn(env, alg=alg, numOfTrials=numOfTrials, seed=seed, **kwargs)
+	return agent.model, agent.history
+
 """
 # lets test it on simple4
 a = Agent()
@@ -44,7 +44,22 @@ def test():
 	from pprint import pprint
 	pprint(success)
 
+def testMerge():
+	"""
+	Merging a model into an empty one has to reproduce its
+	utilities and policy.
+	"""
+	args = (e.MARIBOR, a.adp_random_exploration, 20, 1, {})
+	model = a._learnWorker(args)[0]
+	merged = a.TransitionModel()
+	merged.merge(model)
+	ns = len(model.states)
+	assert merged.states == model.states
+	assert (merged.U[:ns] == model.U[:ns]).all()
+	assert merged.getPolicy() == model.getPolicy()
+
 if __name__ == '__main__':
 	
+		testMerge()
 		test()
 